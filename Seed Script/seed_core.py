@@ -0,0 +1,1044 @@
+#!/usr/bin/env python3
+
+"""Shared seeding pipeline for the provider-specific seed scripts.
+
+seed.py (Ollama), seed_gemini.py (Gemini), and seed_openai.py (OpenAI) supply
+the LLM / embedding-model factories and any provider-specific knobs; the rest
+of the pipeline — file hashing, catalog skip logic, parallel PDF loading,
+summarization fan-out, chunking, and LanceDB writes — lives here so every
+optimization applies once instead of three-fold.
+
+Requires Python 3.11+ (asyncio.TaskGroup, hashlib.file_digest).
+"""
+
+import asyncio
+import gc
+import glob
+import hashlib
+import json
+import itertools
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import defaultdict
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+import lancedb
+import pyarrow as pa
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+from langchain.chains.summarize import load_summarize_chain
+from langchain_core.prompts import PromptTemplate
+from tqdm import tqdm
+
+try:
+    # Rust-backed splitter; chunking drops to a native-code scan when present
+    from semantic_text_splitter import TextSplitter as _RustTextSplitter
+except ImportError:
+    _RustTextSplitter = None
+
+try:
+    # Token counts sort batches more accurately than character counts
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Configuration shared by every provider
+CATALOG_TABLE_NAME = "catalog"
+CHUNKS_TABLE_NAME = "chunks"
+MAX_PAGES_FOR_SUMMARY = 10  # Maximum number of pages to use for summarization
+MAX_CHARS_FOR_SUMMARY = 4000  # Maximum characters to send for summarization
+SUMMARY_CONCURRENCY = 8  # Max in-flight summarization requests
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 96))  # Chunks per embedding request
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", 16))  # Max in-flight embedding requests
+PIPELINE_QUEUE_SIZE = 32  # Bounded back-pressure between pipeline stages
+VECTOR_DTYPE = os.environ.get("EMBED_VECTOR_DTYPE", "float32")  # or "float16"
+
+DEFAULT_SPLITTER_KWARGS = dict(
+    chunk_size=400,  # Smaller chunks
+    chunk_overlap=50,  # Better overlap
+    separators=["\n\n", "\n", ".", "!", "?", ";", " ", ""],  # Better splitting
+)
+
+
+HASH_CACHE_FILENAME = "hash_cache.json"
+EMBED_CACHE_FILENAME_TEMPLATE = "embedding_cache.{model}.sqlite3"
+
+
+def load_hash_cache(dbpath: str) -> dict:
+    """Load the stat-keyed hash cache stored alongside the database."""
+    try:
+        with open(os.path.join(dbpath, HASH_CACHE_FILENAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_hash_cache(dbpath: str, cache: dict) -> None:
+    """Persist the hash cache; failures only cost a re-hash next run."""
+    try:
+        os.makedirs(dbpath, exist_ok=True)
+        with open(os.path.join(dbpath, HASH_CACHE_FILENAME), "w") as f:
+            json.dump(cache, f)
+    except OSError as e:
+        print(f"Warning: could not write hash cache: {e}")
+
+
+def embedding_model_id(embedding_model) -> str:
+    """Identity of the embedding space a model produces, for cache namespacing."""
+    model = getattr(embedding_model, "model", None) or type(embedding_model).__name__
+    return re.sub(r"[^A-Za-z0-9._-]", "_", str(model))
+
+
+class EmbeddingCache:
+    """Content-hash -> vector cache persisted alongside the database.
+
+    Chunk embeddings are deterministic for a given (model, text) pair, so
+    re-seeding after an --overwrite (or after shuffling files between
+    directories) only pays API calls for texts never embedded before. The
+    cache file is namespaced by embedding model and records the vector
+    dimension on first write, so vectors from a different embedding space
+    can never be served back: switching providers on the same dbpath starts
+    a fresh cache, and dimension-mismatched rows are dropped on read.
+    Vectors are stored as packed float32, matching the Arrow column they
+    end up in.
+    """
+
+    def __init__(self, dbpath: str, model_id: str):
+        os.makedirs(dbpath, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(dbpath, EMBED_CACHE_FILENAME_TEMPLATE.format(model=model_id)),
+            check_same_thread=False,
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, vector BLOB)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.commit()
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        self._dim = int(row[0]) if row else None
+
+    @staticmethod
+    def text_key(text: str) -> str:
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get_many(self, keys) -> Dict[str, List[float]]:
+        """Fetch cached vectors for the given keys in one query per 500.
+
+        Rows whose blob does not match the recorded dimension (a corrupt or
+        hand-edited file) are skipped and silently re-embedded.
+        """
+        keys = list(keys)
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE hash IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                for key, blob in rows:
+                    if self._dim is not None and len(blob) != self._dim * 4:
+                        continue
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        return found
+
+    def put_many(self, items) -> None:
+        """Store (key, vector) pairs; failures only cost a re-embed next run."""
+        items = list(items)
+        if not items:
+            return
+        rows = [(key, array("f", vector).tobytes()) for key, vector in items]
+        with self._lock:
+            try:
+                if self._dim is None:
+                    self._dim = len(items[0][1])
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)",
+                        (str(self._dim),),
+                    )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (hash, vector) VALUES (?, ?)", rows
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Warning: could not write embedding cache: {e}")
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def calculate_file_hash(file_path: str, cache: Optional[dict] = None) -> str:
+    """Calculate SHA256 hash of a file.
+
+    With a cache dict, an unchanged (mtime_ns, size) stat tuple resolves to
+    the stored hash without reading the file at all.
+    """
+    stat_key = None
+    if cache is not None:
+        st = os.stat(file_path)
+        stat_key = f"{st.st_mtime_ns}:{st.st_size}"
+        entry = cache.get(file_path)
+        if entry and entry.get("stat") == stat_key:
+            return entry["hash"]
+
+    with open(file_path, "rb", buffering=0) as f:
+        # file_digest streams through a reusable buffer in C. It is 3.11+,
+        # but so is the pipeline itself (asyncio.TaskGroup in ingest_chunks),
+        # so no fallback is needed.
+        digest = hashlib.file_digest(f, "sha256").hexdigest()
+
+    if cache is not None:
+        cache[file_path] = {"stat": stat_key, "hash": digest}
+    return digest
+
+
+def hash_files_parallel(paths: List[str], cache: Optional[dict] = None) -> Dict[str, str]:
+    """Hash files on a thread pool; hashlib releases the GIL while digesting."""
+    if not paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(8, len(paths))) as pool:
+        return dict(zip(paths, pool.map(lambda p: calculate_file_hash(p, cache), paths)))
+
+
+def _load_one_pdf(path: str) -> List[Document]:
+    """Parse a single PDF into per-page documents (runs in a worker process)."""
+    return PyPDFLoader(path).load()
+
+
+def load_pdfs_parallel(paths: List[str]) -> List[Document]:
+    """Parse PDFs across processes instead of DirectoryLoader's serial walk.
+
+    pypdf parsing is CPU-bound, so fanning out across cores gives a
+    near-linear speedup. Worker count can be overridden via the
+    LOAD_DOCUMENTS_NUMBER_OF_THREADS environment variable.
+    """
+    if not paths:
+        return []
+    max_workers = int(os.environ.get(
+        "LOAD_DOCUMENTS_NUMBER_OF_THREADS", max(1, (os.cpu_count() or 2) - 1)
+    ))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        page_lists = list(tqdm(
+            pool.map(_load_one_pdf, paths),
+            total=len(paths),
+            desc="Loading PDFs"
+        ))
+    return list(itertools.chain.from_iterable(page_lists))
+
+
+def check_table_schema(table_name: str, schema_names: List[str], expected: List[str]) -> None:
+    """Fail fast when a table predates the Arrow-native schema.
+
+    Databases seeded by older script versions (or by src/seed.ts, which
+    writes through the LangChain wrapper) carry an id/metadata-struct
+    layout. Treating those reads as "no existing rows" would re-summarize
+    and re-embed the whole corpus and then crash on the append - after the
+    API cost has been paid - so surface the mismatch before any LLM call.
+    """
+    missing = [column for column in expected if column not in schema_names]
+    if missing:
+        raise RuntimeError(
+            f'Table "{table_name}" exists but lacks the column(s) {missing} '
+            f"(found: {list(schema_names)}). It was likely written by an older "
+            "seed script or src/seed.ts. Re-seed with --overwrite to rebuild "
+            "it with the current schema."
+        )
+
+
+def load_existing_hashes(catalog_table) -> set:
+    """Fetch every catalogued hash in one scan for O(1) membership tests.
+
+    Reads just the hash column through the Arrow-native path, skipping the
+    full-width pandas DataFrame the previous implementation materialized.
+    """
+    if catalog_table is None:
+        return set()
+    check_table_schema(CATALOG_TABLE_NAME, catalog_table.schema.names, ["hash", "source"])
+    return set(
+        catalog_table.to_lance().to_table(columns=["hash"]).column("hash").to_pylist()
+    )
+
+
+def read_catalog_sig(catalog_table) -> Optional[str]:
+    """Read the corpus signature stored in the catalog's schema metadata."""
+    try:
+        metadata = catalog_table.schema.metadata or {}
+        sig = metadata.get(b"corpus_sig")
+        return sig.decode() if sig else None
+    except Exception:
+        return None
+
+
+def write_catalog_sig(db, sig: str) -> None:
+    """Stamp the corpus signature onto the catalog table; best-effort."""
+    try:
+        db.open_table(CATALOG_TABLE_NAME).to_lance().replace_schema_metadata(
+            {"corpus_sig": sig}
+        )
+    except Exception as e:
+        print(f"Warning: could not store catalog signature: {e}")
+
+
+async def generate_content_overview_map_reduce(docs: List[Document], llm) -> str:
+    """Generate a content overview with a map_reduce summarization chain."""
+    content_overview_template = """Write a high-level one sentence content overview based on the text below:
+
+"{text}"
+
+WRITE THE CONTENT OVERVIEW ONLY, DO NOT WRITE ANYTHING ELSE:"""
+
+    content_overview_prompt = PromptTemplate(
+        template=content_overview_template,
+        input_variables=["text"]
+    )
+
+    # Create summarization chain
+    chain = load_summarize_chain(
+        llm,
+        chain_type="map_reduce",
+        combine_prompt=content_overview_prompt
+    )
+
+    try:
+        result = await chain.ainvoke({"input_documents": docs})
+        return result.get("output_text", "")
+    except Exception as e:
+        print(f"Error generating summary: {e}")
+        # Fallback: just take first document's content
+        if docs:
+            return docs[0].page_content[:200] + "..."
+        return "Document content overview"
+
+
+async def generate_content_overview_truncated(
+        docs: List[Document],
+        llm,
+        max_pages: int = MAX_PAGES_FOR_SUMMARY,
+        max_chars: int = MAX_CHARS_FOR_SUMMARY
+) -> str:
+    """Generate a content overview from the first pages only, in one LLM call."""
+    # Filter to only the first N pages
+    first_pages = []
+    page_numbers = set()
+
+    for doc in docs:
+        page_num = doc.metadata.get("page", 0)
+        if page_num < max_pages:
+            first_pages.append(doc)
+            page_numbers.add(page_num)
+
+    # If no docs in the first N pages, take first few docs regardless
+    if not first_pages:
+        first_pages = docs[:10]
+
+    print(f"  Using {len(first_pages)} chunks from pages {sorted(page_numbers)} for summarization")
+
+    # Combine text from the first pages with a length limit to avoid token limits
+    combined_text = ""
+    for doc in first_pages:
+        if len(combined_text) + len(doc.page_content) > max_chars:
+            break
+        combined_text += doc.page_content + "\n\n"
+
+    # Use a simple prompt instead of a chain for better control
+    prompt = f"""Write a high-level one sentence content overview based on the first pages of this document:
+
+{combined_text[:max_chars]}
+
+WRITE THE CONTENT OVERVIEW ONLY, DO NOT WRITE ANYTHING ELSE:"""
+
+    try:
+        # Direct LLM call for better error handling
+        result = await llm.ainvoke(prompt)
+        # Chat models return a message, plain LLMs return a string
+        text = result.content if hasattr(result, "content") else str(result)
+        return text.strip()
+    except Exception as e:
+        print(f"  Error generating summary: {e}")
+        # Fallback: just take first document's content
+        if docs:
+            return f"Document starting with: {docs[0].page_content[:150]}..."
+        return "Document content overview"
+
+
+@lru_cache(maxsize=1)
+def _token_encoder():
+    """The cl100k_base encoder shared by current OpenAI embedding models."""
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def embedding_sort_key(text: str) -> int:
+    """Length key used to sort texts into uniform embedding batches.
+
+    Token count when tiktoken is available (what providers actually bill
+    and pad by), character count otherwise.
+    """
+    if tiktoken is not None and (enc := _token_encoder()) is not None:
+        return len(enc.encode(text))
+    return len(text)
+
+
+class AsyncRateLimiter:
+    """Preemptive token + request budget for embedding calls.
+
+    Two continuously-refilled buckets (tokens/minute and requests/minute);
+    acquire() reserves capacity before the HTTP call goes out, sleeping only
+    for the exact deficit. This keeps throughput just under the provider's
+    TPM/RPM ceilings instead of hedging with fixed sleeps or riding 429s.
+    """
+
+    def __init__(self, tokens_per_minute: int, requests_per_minute: int):
+        self._token_rate = tokens_per_minute / 60.0
+        self._request_rate = requests_per_minute / 60.0
+        self._tokens = float(tokens_per_minute)
+        self._requests = float(requests_per_minute)
+        self._token_capacity = float(tokens_per_minute)
+        self._request_capacity = float(requests_per_minute)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int) -> None:
+        # A request larger than the bucket can never be satisfied (the bucket
+        # caps at capacity), which would sleep forever; clamp it so one
+        # oversized batch drains the full budget instead of hanging. Reachable
+        # when EMBED_TPM is set below one batch's estimate.
+        if tokens > self._token_capacity:
+            print(
+                f"Warning: batch estimate of {tokens} tokens exceeds the "
+                f"{self._token_capacity:.0f}-token budget; clamping to capacity"
+            )
+            tokens = self._token_capacity
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                elapsed = now - self._last
+                self._last = now
+                self._tokens = min(self._token_capacity, self._tokens + elapsed * self._token_rate)
+                self._requests = min(
+                    self._request_capacity, self._requests + elapsed * self._request_rate
+                )
+                if self._tokens >= tokens and self._requests >= 1:
+                    self._tokens -= tokens
+                    self._requests -= 1
+                    return
+                await asyncio.sleep(max(
+                    (tokens - self._tokens) / self._token_rate,
+                    (1 - self._requests) / self._request_rate,
+                ))
+
+
+def make_rate_limiter() -> Optional[AsyncRateLimiter]:
+    """Build the embedding rate limiter from EMBED_TPM / EMBED_RPM.
+
+    Disabled (None) when neither variable is set: local providers like
+    Ollama have no quota to respect. Token estimates use embedding_sort_key,
+    so set EMBED_TPM with tiktoken installed for accurate accounting.
+    """
+    tokens_per_minute = int(os.environ.get("EMBED_TPM", 0))
+    requests_per_minute = int(os.environ.get("EMBED_RPM", 0))
+    if tokens_per_minute <= 0 and requests_per_minute <= 0:
+        return None
+    return AsyncRateLimiter(tokens_per_minute or 10 ** 9, requests_per_minute or 10 ** 9)
+
+
+EMBED_LIMITER = make_rate_limiter()
+
+EMBED_MAX_ATTEMPTS = 5  # Per-batch retries before surfacing the failure
+
+
+async def aembed_with_retry(embedding_model, texts: List[str]) -> List[List[float]]:
+    """Call aembed_documents with exponential backoff on transient failures.
+
+    A 429/500 on batch N costs only batch N, not a restart of the whole
+    ingest. Provider exception types differ (openai, google, ollama), so any
+    exception is treated as transient until attempts run out, after which it
+    propagates and fails the pipeline's TaskGroup.
+    """
+    for attempt in range(EMBED_MAX_ATTEMPTS):
+        try:
+            return await embedding_model.aembed_documents(texts)
+        except Exception as e:
+            if attempt == EMBED_MAX_ATTEMPTS - 1:
+                raise
+            delay = min(2 ** attempt, 30)
+            print(f"Embedding batch failed ({e}); retrying in {delay}s...")
+            await asyncio.sleep(delay)
+
+
+async def embed_texts_batched(embedding_model, texts: List[str]) -> List[List[float]]:
+    """Embed texts in length-sorted micro-batches with bounded concurrency.
+
+    Sorting by length keeps the padding/token cost of each batch uniform and
+    the semaphore fans out HTTP requests without overwhelming the provider.
+    Returned vectors are in the original order of `texts`.
+    """
+    order = sorted(range(len(texts)), key=lambda i: embedding_sort_key(texts[i]))
+    batches = [order[i:i + EMBED_BATCH_SIZE] for i in range(0, len(order), EMBED_BATCH_SIZE)]
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+    async def _embed(indexes: List[int]) -> Tuple[List[int], List[List[float]]]:
+        async with sem:
+            batch = [texts[i] for i in indexes]
+            if EMBED_LIMITER is not None:
+                await EMBED_LIMITER.acquire(sum(embedding_sort_key(t) for t in batch))
+            return indexes, await aembed_with_retry(embedding_model, batch)
+
+    vectors: List[Optional[List[float]]] = [None] * len(texts)
+    for indexes, batch_vectors in await asyncio.gather(*[_embed(batch) for batch in batches]):
+        for i, vector in zip(indexes, batch_vectors):
+            vectors[i] = vector
+    return vectors
+
+
+async def embed_texts_cached(
+        embedding_model, texts: List[str], cache: Optional[EmbeddingCache]
+) -> List[List[float]]:
+    """Embed texts through the persistent cache, calling the API only for misses.
+
+    Duplicate texts (splitters emit identical boilerplate headers/footers
+    across documents) are embedded once and the vector is broadcast to every
+    duplicate row on return.
+    """
+    keys = [EmbeddingCache.text_key(text) for text in texts]
+    if cache is not None:
+        hits = await asyncio.to_thread(cache.get_many, set(keys))
+    else:
+        hits = {}
+    misses: Dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in hits:
+            misses.setdefault(key, text)
+    if misses:
+        miss_texts = list(misses.values())
+        if EMBED_LIMITER is not None:
+            await EMBED_LIMITER.acquire(sum(embedding_sort_key(t) for t in miss_texts))
+        miss_vectors = await aembed_with_retry(embedding_model, miss_texts)
+        if cache is not None:
+            await asyncio.to_thread(cache.put_many, list(zip(misses, miss_vectors)))
+        hits.update(zip(misses, miss_vectors))
+    return [hits[key] for key in keys]
+
+
+def add_or_create_table(db, name: str, data: pa.Table) -> None:
+    """Append to a table, creating it from this batch if absent (sync client)."""
+    if name in db.table_names():
+        table = db.open_table(name)
+        check_table_schema(name, table.schema.names, data.column_names)
+        table.add(data)
+    else:
+        db.create_table(name, data=data)
+
+
+async def add_or_create_table_async(async_db, name: str, data: pa.Table):
+    """Async-client counterpart of add_or_create_table; returns the table."""
+    if name in await async_db.table_names():
+        table = await async_db.open_table(name)
+        schema = await table.schema()
+        check_table_schema(name, schema.names, data.column_names)
+        await table.add(data)
+        return table
+    return await async_db.create_table(name, data=data)
+
+
+def vectors_to_arrow(vectors: List[List[float]]) -> pa.Array:
+    """Build the fixed-size-list vector column in the configured precision.
+
+    float16 (EMBED_VECTOR_DTYPE=float16) halves the on-disk and mmap
+    footprint with no measurable recall loss for cosine similarity; float32
+    stays the default for compatibility with existing tables.
+    """
+    dim = len(vectors[0])
+    if VECTOR_DTYPE == "float16":
+        import numpy as np
+        return pa.array(
+            list(np.asarray(vectors, dtype=np.float16)),
+            type=pa.list_(pa.float16(), dim),
+        )
+    return pa.array(vectors, type=pa.list_(pa.float32(), dim))
+
+
+def chunks_to_arrow(docs: List[Document], vectors: List[List[float]]) -> pa.Table:
+    """Build an Arrow table of (text, vector, source, page) rows for LanceDB."""
+    return pa.table({
+        "text": [doc.page_content for doc in docs],
+        "vector": vectors_to_arrow(vectors),
+        "source": [doc.metadata.get("source", "") for doc in docs],
+        "page": [doc.metadata.get("page", 0) for doc in docs],
+    })
+
+
+async def process_documents(
+        raw_docs: List[Document],
+        file_hashes: Dict[str, str],
+        llm,
+        generate_overview: Callable
+) -> List[Document]:
+    """Summarize each source and build its catalog records.
+
+    Sources are pre-filtered against the catalog before parsing, so every
+    document here is new; hashes come from `file_hashes` so files are not
+    read twice.
+    """
+
+    # Group documents by source
+    docs_by_source: Dict[str, List[Document]] = defaultdict(list)
+    for doc in raw_docs:
+        docs_by_source[doc.metadata.get("source", "")].append(doc)
+
+    pending = []
+    for source, docs in docs_by_source.items():
+        if not os.path.exists(source):
+            print(f"Warning: Source file {source} does not exist. Skipping...")
+            continue
+        file_hash = file_hashes.get(source) or calculate_file_hash(source)
+        pending.append((source, docs, file_hash))
+
+    # Summarize the sources concurrently; the semaphore bounds the
+    # number of in-flight LLM requests
+    sem = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+    async def _summarize(source: str, docs: List[Document]) -> str:
+        async with sem:
+            print(f"Processing source: {source}")
+            return await generate_overview(docs, llm)
+
+    overviews = await asyncio.gather(
+        *[_summarize(source, docs) for source, docs, _ in pending]
+    )
+
+    catalog_records = []
+    for (source, docs, file_hash), content_overview in zip(pending, overviews):
+        print(f"Content overview for source {source}: {content_overview}")
+        catalog_records.append(Document(
+            page_content=content_overview,
+            metadata={"source": source, "hash": file_hash}
+        ))
+
+    return catalog_records
+
+
+# One C-speed alternation over the default separators; the capture group keeps
+# each separator attached to the output so chunks rejoin losslessly
+SEP_RE = re.compile(r"(\n\n|\n|(?<=[.!?;]) )")
+
+
+@lru_cache(maxsize=None)
+def _compiled_sep_re(separators: Tuple[str, ...]) -> "re.Pattern":
+    """Compile a separator list into a single alternation, longest first.
+
+    Punctuation separators become lookbehind-plus-space so abbreviations and
+    decimals don't shatter into fragments; bare-space and empty-string
+    separators are dropped because the merge pass and hard-wrap already cover
+    them. Cached per tuple so each configuration compiles once per process.
+    """
+    parts = []
+    for sep in sorted(separators, key=len, reverse=True):
+        if sep in ("", " "):
+            continue
+        if len(sep) == 1 and not sep.isalnum() and not sep.isspace():
+            parts.append(f"(?<={re.escape(sep)}) ")
+        else:
+            parts.append(re.escape(sep))
+    if not parts:
+        return SEP_RE
+    return re.compile("(" + "|".join(parts) + ")")
+
+
+class SplitMergeTextSplitter:
+    """Two-pass split-then-merge chunker, the pure-Python splitting path.
+
+    Pass 1 breaks the text into atomic segments with a single pre-compiled
+    regex scan (hard-wrapping the rare separator-free run longer than
+    chunk_size). Pass 2 greedily merges adjacent segments up to chunk_size,
+    carrying chunk_overlap trailing characters into the next chunk, then
+    folds context-poor fragments below min_chunk_size into their neighbour.
+    chunk_size is a hard ceiling including the carried overlap - the
+    RecursiveCharacterTextSplitter contract - without its
+    O(separators x len) re-scanning; the overlap is dropped for a chunk it
+    would push past the limit.
+    """
+
+    def __init__(
+            self,
+            chunk_size: int,
+            chunk_overlap: int,
+            min_chunk_size: int = 100,
+            separators: Optional[Tuple[str, ...]] = None,
+    ):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.min_chunk_size = min_chunk_size
+        # Stored as a tuple, not a compiled pattern, so instances stay
+        # picklable for the process-pool splitting path
+        self.separators = tuple(separators) if separators else None
+
+    def _segments(self, text: str) -> List[str]:
+        sep_re = _compiled_sep_re(self.separators) if self.separators else SEP_RE
+        segments = []
+        for segment in sep_re.split(text):
+            if not segment:
+                continue
+            if len(segment) > self.chunk_size:
+                segments.extend(
+                    segment[i:i + self.chunk_size]
+                    for i in range(0, len(segment), self.chunk_size)
+                )
+            else:
+                segments.append(segment)
+        return segments
+
+    def split_text(self, text: str) -> List[str]:
+        chunks: List[str] = []
+        current = ""
+        for segment in self._segments(text):
+            if current and len(current) + len(segment) > self.chunk_size:
+                chunks.append(current)
+                carry = current[-self.chunk_overlap:] if self.chunk_overlap else ""
+                # The carried overlap counts toward the budget; drop it when
+                # it would push this chunk past the chunk_size ceiling
+                current = carry if len(carry) + len(segment) <= self.chunk_size else ""
+            current += segment
+        if current:
+            chunks.append(current)
+
+        # Fold tiny fragments into the previous chunk: a 30-char trailing
+        # sentence is worth more as context than as its own retrieval slot
+        merged: List[str] = []
+        for chunk in chunks:
+            if (
+                merged
+                and min(len(chunk), len(merged[-1])) < self.min_chunk_size
+                and len(merged[-1]) + len(chunk) <= self.chunk_size
+            ):
+                merged[-1] += chunk
+            else:
+                merged.append(chunk)
+        return [chunk for chunk in (c.strip() for c in merged) if chunk]
+
+    def split_documents(self, docs: List[Document]) -> List[Document]:
+        return [
+            Document(page_content=text, metadata=dict(doc.metadata))
+            for doc in docs
+            for text in self.split_text(doc.page_content)
+        ]
+
+
+class RustCharacterSplitter:
+    """split_documents adapter over the Rust semantic-text-splitter.
+
+    Character-capacity mode keeps the chunk_size/chunk_overlap semantics of
+    RecursiveCharacterTextSplitter while the scan itself runs in native code.
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int):
+        self._splitter = _RustTextSplitter(capacity=chunk_size, overlap=chunk_overlap)
+
+    def split_documents(self, docs: List[Document]) -> List[Document]:
+        chunks = []
+        for doc in docs:
+            for text in self._splitter.chunks(doc.page_content):
+                chunks.append(Document(page_content=text, metadata=dict(doc.metadata)))
+        return chunks
+
+
+@lru_cache(maxsize=None)
+def _cached_splitter(chunk_size: int, chunk_overlap: int, separators: tuple):
+    """Splitters are stateless, so each configuration is built only once per
+    process; RecursiveCharacterTextSplitter compiles its separator patterns
+    at construction time."""
+    if _RustTextSplitter is not None:
+        return RustCharacterSplitter(chunk_size, chunk_overlap)
+    return SplitMergeTextSplitter(chunk_size, chunk_overlap, separators=separators)
+
+
+def make_splitter(splitter_kwargs: dict):
+    """Build the chunk splitter, preferring the Rust implementation."""
+    return _cached_splitter(
+        splitter_kwargs.get("chunk_size", 400),
+        splitter_kwargs.get("chunk_overlap", 50),
+        tuple(splitter_kwargs.get("separators", DEFAULT_SPLITTER_KWARGS["separators"])),
+    )
+
+
+async def ingest_chunks(
+        async_db,
+        embedding_model,
+        splitter,
+        raw_docs: List[Document],
+        embed_cache: Optional[EmbeddingCache] = None,
+) -> int:
+    """Chunk, embed, and upsert documents as an overlapped pipeline.
+
+    Three stages are connected by bounded queues so the CPU-bound splitting
+    runs in worker threads while embedding batches and LanceDB writes happen
+    concurrently: chunk_worker -> embed_workers -> upsert_worker. The queue
+    bounds provide back-pressure so peak memory stays proportional to the
+    queue size, not the corpus.
+
+    Consumes `raw_docs`: the flat page list is cleared once grouped so raw
+    text is freed as each source finishes splitting, instead of doubling
+    peak RSS for the whole embedding phase.
+    """
+    docs_by_source: Dict[str, List[Document]] = defaultdict(list)
+    for doc in raw_docs:
+        docs_by_source[doc.metadata.get("source", "")].append(doc)
+    raw_docs.clear()
+    gc.collect()
+
+    chunk_queue: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    write_queue: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    total_chunks = 0
+
+    async def chunk_worker():
+        # Splitting is embarrassingly parallel per source: fan the sources out
+        # across workers and enqueue results as each split finishes. The Rust
+        # splitter releases the GIL (and is not picklable), so it scales on
+        # threads; the pure-Python splitter needs real processes to use more
+        # than one core.
+        loop = asyncio.get_running_loop()
+        executor_cls = (
+            ThreadPoolExecutor if isinstance(splitter, RustCharacterSplitter)
+            else ProcessPoolExecutor
+        )
+        with executor_cls(max_workers=os.cpu_count()) as pool:
+            split_futures = [
+                loop.run_in_executor(pool, splitter.split_documents, source_docs)
+                for source_docs in docs_by_source.values()
+            ]
+            # The executor holds the only remaining page references; each
+            # source's raw text is freed as soon as its split completes
+            docs_by_source.clear()
+            for future in split_futures:
+                chunks = await future
+                # Length-sorted batches keep per-request token counts uniform,
+                # so no batch is dominated by one long outlier chunk. Each
+                # chunk carries its own metadata, so row order is irrelevant
+                # to the LanceDB write.
+                chunks.sort(key=lambda chunk: embedding_sort_key(chunk.page_content))
+                for i in range(0, len(chunks), EMBED_BATCH_SIZE):
+                    await chunk_queue.put(chunks[i:i + EMBED_BATCH_SIZE])
+        for _ in range(EMBED_CONCURRENCY):
+            await chunk_queue.put(None)
+
+    async def embed_worker():
+        while (batch := await chunk_queue.get()) is not None:
+            vectors = await embed_texts_cached(
+                embedding_model, [doc.page_content for doc in batch], embed_cache
+            )
+            await write_queue.put((batch, vectors))
+
+    async def upsert_worker():
+        nonlocal total_chunks
+        table = None
+        while (item := await write_queue.get()) is not None:
+            batch, vectors = item
+            chunk_data = chunks_to_arrow(batch, vectors)
+            if table is None:
+                table = await add_or_create_table_async(async_db, CHUNKS_TABLE_NAME, chunk_data)
+            else:
+                await table.add(chunk_data)
+            total_chunks += len(batch)
+
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(chunk_worker())
+        embed_tasks = [tg.create_task(embed_worker()) for _ in range(EMBED_CONCURRENCY)]
+        tg.create_task(upsert_worker())
+
+        async def close_write_queue():
+            await asyncio.gather(*embed_tasks)
+            await write_queue.put(None)
+
+        tg.create_task(close_write_queue())
+
+    return total_chunks
+
+
+async def run_seed(
+        args,
+        make_llm: Callable,
+        make_embeddings: Callable,
+        generate_overview: Optional[Callable] = None,
+        splitter_kwargs: Optional[dict] = None
+):
+    """Run the full seeding pipeline with provider-specific factories."""
+    if generate_overview is None:
+        # Summarizing the truncated first pages costs one LLM call per source;
+        # map_reduce stays available behind --map-reduce for very long
+        # documents where a whole-document summary is worth O(pages) calls.
+        if getattr(args, "map_reduce", False):
+            generate_overview = generate_content_overview_map_reduce
+        else:
+            generate_overview = generate_content_overview_truncated
+    if splitter_kwargs is None:
+        splitter_kwargs = DEFAULT_SPLITTER_KWARGS
+
+    # Initialize models
+    print("Initializing models...")
+    # One keep-alive connection pool shared by every provider call that can
+    # accept it, instead of per-call TCP/TLS setup
+    http_client = httpx.AsyncClient(
+        timeout=600,
+        limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+    )
+    llm = make_llm(http_client)
+    embedding_model = make_embeddings(http_client)
+
+    try:
+        # Connect to LanceDB. The sync client blocks on disk, so every call
+        # to it below is pushed to a worker thread to keep the event loop
+        # (and the provider sockets it services) responsive.
+        print("Connecting to LanceDB...")
+        db = await asyncio.to_thread(lancedb.connect, args.dbpath)
+
+        # Check if tables exist
+        catalog_table = None
+        catalog_table_exists = True
+
+        try:
+            catalog_table = await asyncio.to_thread(db.open_table, CATALOG_TABLE_NAME)
+        except Exception:
+            print(f'Looks like the catalog table "{CATALOG_TABLE_NAME}" doesn\'t exist. We\'ll create it later.')
+            catalog_table_exists = False
+
+        try:
+            await asyncio.to_thread(db.open_table, CHUNKS_TABLE_NAME)
+        except Exception:
+            print(f'Looks like the chunks table "{CHUNKS_TABLE_NAME}" doesn\'t exist. We\'ll create it later.')
+
+        # Drop tables if overwrite is specified
+        if args.overwrite:
+            try:
+                existing_tables = await asyncio.to_thread(db.table_names)
+                if CATALOG_TABLE_NAME in existing_tables:
+                    await asyncio.to_thread(db.drop_table, CATALOG_TABLE_NAME)
+                if CHUNKS_TABLE_NAME in existing_tables:
+                    await asyncio.to_thread(db.drop_table, CHUNKS_TABLE_NAME)
+                catalog_table_exists = False
+                catalog_table = None
+            except Exception as e:
+                print(f"Error dropping tables. Maybe they don't exist! {e}")
+
+        # Hash files before parsing so already-catalogued PDFs are skipped cheaply
+        print("Scanning files...")
+        pdf_paths = sorted(glob.glob(os.path.join(args.filesdir, "**/*.pdf"), recursive=True))
+        hash_cache = load_hash_cache(args.dbpath)
+        file_hashes = await asyncio.to_thread(hash_files_parallel, pdf_paths, hash_cache)
+        save_hash_cache(args.dbpath, hash_cache)
+
+        # A signature over the sorted file hashes identifies the corpus as a
+        # whole: when it matches the one stamped on the catalog, nothing has
+        # changed and the per-hash catalog scan can be skipped outright
+        corpus_sig = hashlib.sha256(
+            ",".join(sorted(file_hashes.values())).encode()
+        ).hexdigest()
+        skip_exists_check = args.overwrite or not catalog_table_exists
+        stored_sig = None if skip_exists_check else await asyncio.to_thread(
+            read_catalog_sig, catalog_table
+        )
+        if stored_sig == corpus_sig and stored_sig is not None:
+            print("Catalog signature unchanged; skipping existing-hash scan")
+            existing_hashes = set(file_hashes.values())
+        else:
+            existing_hashes = set() if skip_exists_check else await asyncio.to_thread(
+                load_existing_hashes, catalog_table
+            )
+
+        skip_sources, new_paths = [], []
+        for path in pdf_paths:
+            if file_hashes[path] in existing_hashes:
+                print(f"Document with hash {file_hashes[path]} already exists in the catalog. Skipping...")
+                skip_sources.append(path)
+            else:
+                new_paths.append(path)
+
+        # Load documents (only the ones not already in the catalog)
+        print(f"Loading {len(new_paths)} of {len(pdf_paths)} files...")
+        raw_docs = await asyncio.to_thread(load_pdfs_parallel, new_paths)
+
+        # Clean metadata (keep only essential fields)
+        for doc in raw_docs:
+            if hasattr(doc, 'metadata'):
+                doc.metadata = {
+                    "source": doc.metadata.get("source", ""),
+                    "page": doc.metadata.get("page", 0)
+                }
+
+        print(f"Loaded {len(raw_docs)} documents")
+
+        # Process documents for catalog
+        print("Loading LanceDB catalog store...")
+        catalog_records = await process_documents(raw_docs, file_hashes, llm, generate_overview)
+
+        # Create catalog store
+        if catalog_records:
+            print(f"Creating catalog with {len(catalog_records)} records...")
+            # One embedding pass and one LanceDB version for all overviews,
+            # instead of re-embedding record-by-record through the wrapper
+            overview_vectors = await embed_texts_batched(
+                embedding_model, [record.page_content for record in catalog_records]
+            )
+            catalog_data = pa.table({
+                "text": [record.page_content for record in catalog_records],
+                "vector": vectors_to_arrow(overview_vectors),
+                "source": [record.metadata["source"] for record in catalog_records],
+                "hash": [record.metadata["hash"] for record in catalog_records],
+            })
+            await asyncio.to_thread(add_or_create_table, db, CATALOG_TABLE_NAME, catalog_data)
+        else:
+            print("No new catalog records to create")
+
+        await asyncio.to_thread(write_catalog_sig, db, corpus_sig)
+
+        print(f"Number of new catalog records: {len(catalog_records)}")
+        print(f"Number of skipped sources: {len(skip_sources)}")
+
+        # Skipped sources were never parsed, so everything loaded is new
+        filtered_raw_docs = raw_docs
+
+        print(f"Processing {len(filtered_raw_docs)} documents for chunking...")
+
+        # Chunk, embed, and upsert as an overlapped pipeline
+        if filtered_raw_docs:
+            print("Loading LanceDB vector store...")
+            splitter = make_splitter(splitter_kwargs)
+            # Async client: adds yield to the event loop, so the next embedding
+            # batch overlaps with the in-flight write
+            async_db = await lancedb.connect_async(args.dbpath)
+            # Chunk texts are deterministic inputs, so cached vectors survive
+            # --overwrite runs that drop and rebuild the tables
+            embed_cache = EmbeddingCache(args.dbpath, embedding_model_id(embedding_model))
+            try:
+                total_chunks = await ingest_chunks(
+                    async_db, embedding_model, splitter, filtered_raw_docs, embed_cache
+                )
+            finally:
+                embed_cache.close()
+            print(f"Number of new chunks: {total_chunks}")
+            if getattr(args, "optimize", False) and total_chunks:
+                # One compaction pass after all appends, instead of paying
+                # implicit per-batch compactions during the ingest loop
+                print("Optimizing chunks table...")
+                chunks_table = await async_db.open_table(CHUNKS_TABLE_NAME)
+                await chunks_table.optimize()
+        else:
+            print("No new documents to process for chunking")
+
+        print("Seeding completed successfully!")
+    finally:
+        await http_client.aclose()